@@ -1,6 +1,14 @@
 # Import numpy 
 import numpy as np
 import scipy.linalg as linalg
+import scipy.sparse as sparse
+
+try:
+    # Import the sparse Cholesky factorization from CHOLMOD
+    from sksparse import cholmod
+except ImportError:
+    # Fall back to the dense Cholesky factorization from LAPACK
+    cholmod = None
 
 # Import parts of matplotlib for plotting
 import matplotlib.pyplot as plt
@@ -11,6 +19,30 @@ from mpi4py import MPI
 # Import ParOpt
 from paropt import ParOpt
 
+def aligned_zeros(shape, dtype=np.float64, align=64):
+    '''
+    Allocate a zeroed C-ordered array whose data is aligned to the
+    given number of bytes, so that BLAS and LAPACK can use aligned
+    vector loads on it
+
+    input:
+    shape:   the shape of the array
+    dtype:   the data type of the array
+    align:   the alignment in bytes
+
+    returns:
+    a:       the aligned array
+    '''
+
+    # Over-allocate a byte buffer and start the array at the first
+    # aligned address within it
+    dtype = np.dtype(dtype)
+    nbytes = int(np.prod(shape))*dtype.itemsize
+    buf = np.zeros(nbytes + align, dtype=np.uint8)
+    offset = (-buf.ctypes.data) % align
+
+    return buf[offset:offset+nbytes].view(dtype).reshape(shape)
+
 class TrussAnalysis(ParOpt.pyParOptProblem):
     def __init__(self, conn, xpos, loads, bcs, 
                  E, rho, Avals, m_fixed,
@@ -19,9 +51,10 @@ class TrussAnalysis(ParOpt.pyParOptProblem):
         Analysis problem for mass-constrained compliance minimization
         '''
 
-        # Store pointer to the data
-        self.conn = conn
-        self.xpos = xpos
+        # Store the connectivity and the nodal locations as arrays
+        # and keep a pointer to the loads and boundary conditions
+        self.conn = np.asarray(conn, dtype=np.int32).reshape(-1, 2)
+        self.xpos = np.asarray(xpos, dtype=float)
         self.loads = loads
         self.bcs = bcs
 
@@ -62,50 +95,100 @@ class TrussAnalysis(ParOpt.pyParOptProblem):
         # Allocate a vector that stores the gradient of the mass
         self.gmass = np.zeros(self.num_design_vars)
 
-        # Allocate the matrices required
-        self.K = np.zeros((self.nvars, self.nvars))
-        self.Kp = np.zeros((self.nvars, self.nvars))
-        self.f = np.zeros(self.nvars)
-        self.u = np.zeros(self.nvars)
-        self.phi = np.zeros(self.nvars)
+        # Allocate the matrices required. The dense matrix is only
+        # needed when CHOLMOD is not available. The arrays passed to
+        # LAPACK are aligned for the vector instructions.
+        if cholmod is None:
+            self.K = aligned_zeros((self.nvars, self.nvars))
+        self.factor = None
+        self.Asolve = None
+        self.f = aligned_zeros(self.nvars)
+        self.u = aligned_zeros(self.nvars)
+        self.phi = aligned_zeros(self.nvars)
+        self.elong_u = np.zeros(self.nelems)
         
         # Set the scaling of the objective
-        self.obj_scale = None
+        self.obj_scale = 1.0
 
         # Keep track of the different counts
         self.fevals = 0
         self.gevals = 0
         self.hevals = 0
 
-        # Allocate the matrices
-        self.Ke = np.zeros((len(self.conn), 4, 4))
+        # Compute the bar geometry for all the bars in the mesh at
+        # once. The nodes of each bar are ordered so that the element
+        # degrees of freedom are increasing, which places the lower
+        # triangle of each element matrix in the lower triangle of the
+        # global matrix. The element matrices do not depend on the
+        # orientation of the bar.
+        n1 = self.conn.min(axis=1)
+        n2 = self.conn.max(axis=1)
+        xy = self.xpos.reshape(-1, 2)
+        xd, yd = (xy[n2] - xy[n1]).T
+        self.Le = np.hypot(xd, yd)
+        self.C = xd/self.Le
+        self.S = yd/self.Le
+
+        # Store the degrees of freedom for each bar
+        self.elem_dofs = np.column_stack(
+            [2*n1, 2*n1+1, 2*n2, 2*n2+1]).astype(np.int32)
+
+        # Store the axial stiffness per unit area and the direction of
+        # each bar in terms of its degrees of freedom
+        self.k_axial = self.E/self.Le
+        self.bar_dirs = np.column_stack([-self.C, -self.S, self.C, self.S])
+
+        # Set the load vector since the loads do not change
+        self.floads = np.zeros(self.nvars)
+        for node in self.loads:
+            # Add the values to the nodal locations
+            self.floads[2*node] += self.loads[node][0]
+            self.floads[2*node+1] += self.loads[node][1]
+
+        # Store the degrees of freedom with boundary conditions and a
+        # mask that is False for each of them
+        self.bc_mask = np.ones(self.nvars, dtype=bool)
+        for node in self.bcs:
+            for index in self.bcs[node]:
+                self.bc_mask[2*node + index] = False
+        self.bc_dofs = np.nonzero(~self.bc_mask)[0].astype(np.int32)
+
+        # Only the lower triangle of the symmetric stiffness matrix is
+        # assembled: this is all that the Cholesky factorizations use
+        self.Ktril = np.tril_indices(4)
+        rows = self.elem_dofs[:,self.Ktril[0]].ravel()
+        cols = self.elem_dofs[:,self.Ktril[1]].ravel()
+
+        # Set the non-zero pattern of the sparse stiffness matrix.
+        # Entries in the rows and columns with boundary conditions are
+        # dropped and replaced by a unit diagonal entry.
+        self.Kkeep = self.bc_mask[rows] & self.bc_mask[cols]
+        self.Krows = np.concatenate([rows[self.Kkeep], self.bc_dofs])
+        self.Kcols = np.concatenate([cols[self.Kkeep], self.bc_dofs])
+        self.Kbc = np.ones(len(self.bc_dofs))
+
+        # Set the flattened indices of the element matrix entries in
+        # the dense stiffness matrix
+        self.Kflat = rows.astype(np.intp)*self.nvars + cols
+
+        # Store the unique entries of the element stiffness matrices.
+        # Each matrix is (E*A/Le)*[[P, -P], [-P, P]] where P is the
+        # 2x2 matrix [[C**2, C*S], [C*S, S**2]].
+        self.k_cc = self.C**2
+        self.k_cs = self.C*self.S
+        self.k_ss = self.S**2
+        self.Ke_sign = np.array([[1.0, -1.0], [-1.0, 1.0]])
+
+        # The non-zero pattern of the stiffness matrix is fixed, so
+        # perform the symbolic factorization once and only update the
+        # numerical factorization afterwards
+        if cholmod is not None:
+            K = self.assembleSparseMat(np.ones(self.nelems))
+            self.factor = cholmod.analyze(K)
 
         # Compute the gradient of the mass for each bar in the mesh
-        index = 0
-        for bar in self.conn:
-            # Get the first and second node numbers from the bar
-            n1 = bar[0]
-            n2 = bar[1]
-
-            # Compute the nodal locations
-            xd = self.xpos[2*n2] - self.xpos[2*n1]
-            yd = self.xpos[2*n2+1] - self.xpos[2*n1+1]
-            Le = np.sqrt(xd**2 + yd**2)
-            C = xd/Le
-            S = yd/Le
-
-            # Compute the element stiffness matrix
-            self.Ke[index,:,:] = (self.E/Le)*np.array(
-                [[C**2, C*S, -C**2, -C*S],
-                 [C*S, S**2, -C*S, -S**2],
-                 [-C**2, -C*S, C**2, C*S],
-                 [-C*S, -S**2, C*S, S**2]])
-
-            # Compute the gradient of the mass
-            for j in range(self.nmats):
-                self.gmass[self.nblock*index+1+j] += self.rho[j]*Le
-
-            index += 1
+        gmass = self.gmass.reshape(self.nelems, self.nblock)
+        gmass[:,1:] = np.outer(self.Le, self.rho)
 
         # Set the fixed mass
         self.m_fixed = m_fixed
@@ -141,9 +224,9 @@ class TrussAnalysis(ParOpt.pyParOptProblem):
 
         if self.penalization == 'RAMP':
             # Compute the RAMP linearization terms
-            for i in range(len(self.xconst)):
-                self.xconst[i] = x[i]/(1.0 + self.RAMP*(1.0 - x[i]))
-                self.xlinear[i] = (self.RAMP+1.0)/(1.0 + self.RAMP*(1.0 - x[i]))**2
+            denom = 1.0 + self.RAMP*(1.0 - self.xinit)
+            self.xconst[:] = self.xinit/denom
+            self.xlinear[:] = (self.RAMP+1.0)/denom**2
         elif self.penalization == 'SIMP':
             # Compute the SIMP linearization terms
             self.xconst[:] = self.xinit**(self.SIMP)
@@ -159,11 +242,10 @@ class TrussAnalysis(ParOpt.pyParOptProblem):
         Compute the discrete infeasibility measure at a given design point
         '''
         
-        d = np.zeros(self.nelems)
-        for i in range(self.nelems):
-            tnum = self.nblock*i
-            d[i] = 1.0 - (x[tnum] - 1.0)**2 - sum(x[tnum+1:tnum+self.nblock]**2)
-            
+        xm = x.reshape(self.nelems, self.nblock)
+        d = (1.0 - (xm[:,0] - 1.0)**2 -
+             np.einsum('ij,ij->i', xm[:,1:], xm[:,1:]))
+
         return d
 
     def computeLimitDesign(self, x):
@@ -188,39 +270,22 @@ class TrussAnalysis(ParOpt.pyParOptProblem):
 
         if limit:
             self.u[:] = self.getLimitDisplacements(x)
+            self.elong_u[:] = self.getElongations(self.u)
+            self.Asolve = None
         else:
             # Set the cross-sectional areas from the design variable
             # values using the full penalization regardless of whether
             # this is a convex problem or not.
             self.A[:] = self.Avals[0]*self.epsilon
+            xm = x.reshape(self.nelems, self.nblock)[:,1:]
             if self.penalization == 'SIMP':
-                for i in range(len(self.conn)):
-                    for j in range(1, self.nblock):
-                        # Compute the value of the area variable
-                        self.A[i] += self.Avals[j-1]*x[i*self.nblock+j]**self.SIMP
+                self.A += np.dot(xm**self.SIMP, self.Avals)
             else:
-                for i in range(len(self.conn)):
-                    for j in range(1, self.nblock):
-                        # Compute the value of the area variable
-                        val = x[i*self.nblock+j]/(1.0 + self.RAMP*(1 - x[i*self.nblock+j]))
-                        self.A[i] += self.Avals[j-1]*val
-
-            # Evaluate compliance objective
-            self.assembleMat(self.A, self.K)
-            self.assembleLoadVec(self.f)
-            self.applyBCs(self.K, self.f)
-            
-            # Copy the values
-            self.u[:] = self.f[:]
-            
-            # Perform the Cholesky factorization
-            self.L = linalg.cholesky(self.K, lower=True)
-            
-            # Solve the resulting linear system of equations
-            linalg.solve_triangular(self.L, self.u, lower=True,
-                                    trans='N', overwrite_b=True)
-            linalg.solve_triangular(self.L, self.u, lower=True, 
-                                    trans='T', overwrite_b=True)
+                vals = xm/(1.0 + self.RAMP*(1.0 - xm))
+                self.A += np.dot(vals, self.Avals)
+
+            # Compute the displacements
+            self.solveDisplacements(self.A)
 
         return np.dot(self.u, self.f)
 
@@ -253,41 +318,32 @@ class TrussAnalysis(ParOpt.pyParOptProblem):
         # Zero all the areas
         self.A[:] = self.Avals[0]*lb_factor
 
+        # Extract the material selection variables for each bar
+        xm = x.reshape(self.nelems, self.nblock)[:,1:]
+
         if self.opt_type == 'convex':
             # Add up the contributions to the areas from each discrete
             # variable
-            for i in range(len(self.conn)):
-                for j in range(1, self.nblock):
-                    # Compute the value of the area variable
-                    val = (self.xconst[i*self.nblock+j] + 
-                           self.xlinear[i*self.nblock+j]*(x[i*self.nblock+j] - 
-                                                          self.xinit[i*self.nblock+j]))
-                    self.A[i] += self.Avals[j-1]*val
+            xconst = self.xconst.reshape(self.nelems, self.nblock)[:,1:]
+            xlinear = self.xlinear.reshape(self.nelems, self.nblock)[:,1:]
+            xinit = self.xinit.reshape(self.nelems, self.nblock)[:,1:]
+            vals = xconst + xlinear*(xm - xinit)
+            self.A += np.dot(vals, self.Avals)
         elif self.penalization == 'SIMP':
-            for i in range(len(self.conn)):
-                for j in range(1, self.nblock):
-                    # Compute the value of the area variable
-                    self.A[i] += self.Avals[j-1]*(x[i*self.nblock+j]**self.SIMP)
+            self.A += np.dot(xm**self.SIMP, self.Avals)
         elif self.penalization == 'RAMP':
-            for i in range(len(self.conn)):
-                for j in range(1, self.nblock):
-                    # Compute the value of the area variable
-                    val = x[i*self.nblock+j]/(1.0 + self.RAMP*(1.0 - x[i*self.nblock+j]))
-                    self.A[i] += self.Avals[j-1]*val
+            vals = xm/(1.0 + self.RAMP*(1.0 - xm))
+            self.A += np.dot(vals, self.Avals)
         return
 
     def setAreasLinear(self, px):
         '''Set the area as a linearization of the area'''
-        
-        self.A[:] = 0.0
-                      
+
         # Add up the contributions to the areas from each 
         # discrete variable
-        for i in range(len(self.conn)):
-            for j in range(1, self.nblock):
-                # Compute the value of the bar area
-                val = self.xlinear[i*self.nblock+j]*px[i*self.nblock+j]
-                self.A[i] += self.Avals[j-1]*val
+        xlinear = self.xlinear.reshape(self.nelems, self.nblock)[:,1:]
+        pxm = px.reshape(self.nelems, self.nblock)[:,1:]
+        self.A[:] = np.dot(xlinear*pxm, self.Avals)
 
         return
 
@@ -307,27 +363,11 @@ class TrussAnalysis(ParOpt.pyParOptProblem):
         # values
         self.setAreas(x, lb_factor=self.epsilon)
 
-        # Evaluate compliance objective
-        self.assembleMat(self.A, self.K)
-        self.assembleLoadVec(self.f)
-        self.applyBCs(self.K, self.f)
-
-        # Copy the values
-        self.u[:] = self.f[:]
-
-        # Perform the Cholesky factorization
-        self.L = linalg.cholesky(self.K, lower=True)
-            
-        # Solve the resulting linear system of equations
-        linalg.solve_triangular(self.L, self.u, lower=True,
-                                trans='N', overwrite_b=True)
-        linalg.solve_triangular(self.L, self.u, lower=True, 
-                                trans='T', overwrite_b=True)
+        # Compute the displacements
+        self.solveDisplacements(self.A)
 
         # Compute the compliance objective
         obj = np.dot(self.u, self.f)
-        if self.obj_scale is None:
-            self.obj_scale = 1.0
 
         # Scale the compliance objective
         obj = obj/self.obj_scale
@@ -349,56 +389,25 @@ class TrussAnalysis(ParOpt.pyParOptProblem):
         # Add the number of gradient evaluations
         self.gevals += 1
 
-        # Set the areas from the design variable values
-        self.setAreas(x, lb_factor=self.epsilon)
-
         # Zero the objecive and constraint gradients
         gobj[:] = 0.0
 
-        # Set the number of materials
-        nmats = len(self.Avals)+1
+        # Compute the derivative of the compliance with respect to
+        # each bar area: -u_e^{T}*Ke*u_e = -(E/Le)*elong(u)**2
+        g = -self.k_axial*self.elong_u**2
 
+        # Add the contribution to each derivative
+        xm = x.reshape(self.nelems, self.nblock)[:,1:]
         if self.opt_type == 'convex':
-            # Add up the contribution to the gradient
-            for i in range(len(self.conn)):
-                # Get the first and second node numbers from the bar
-                n1 = self.conn[i][0]
-                n2 = self.conn[i][1]
-
-                # Find the element variables
-                ue = np.array([self.u[2*n1], self.u[2*n1+1],
-                               self.u[2*n2], self.u[2*n2+1]])
-
-                # Compute the inner product with the element stiffness matrix
-                g = -np.dot(ue, np.dot(self.Ke[i,:,:], ue))  
-
-                # Add the contribution to each derivative
-                gobj[i*self.nblock+1:(i+1)*self.nblock] += g*(
-                    self.Avals*self.xlinear[i*self.nblock+1:(i+1)*self.nblock])
+            xlinear = self.xlinear.reshape(self.nelems, self.nblock)[:,1:]
+            dA = self.Avals*xlinear
+        elif self.penalization == 'SIMP':
+            # SIMP penalization
+            dA = self.Avals*self.SIMP*xm**(self.SIMP-1.0)
         else:
-            # Add up the contribution to the gradient
-            for i in range(len(self.conn)):
-                # Get the first and second node numbers from the bar
-                n1 = self.conn[i][0]
-                n2 = self.conn[i][1]
-
-                # Find the element variables
-                ue = np.array([self.u[2*n1], self.u[2*n1+1],
-                               self.u[2*n2], self.u[2*n2+1]])
-
-                # Compute the inner product with the element stiffness matrix
-                g = -np.dot(ue, np.dot(self.Ke[i,:,:], ue))  
-
-                # Add the contribution to each derivative
-                if self.penalization == 'SIMP':
-                    # SIMP penalization
-                    simp = self.SIMP*x[i*self.nblock+1:(i+1)*self.nblock]**(self.SIMP-1.0)
-                    gobj[i*self.nblock+1:(i+1)*self.nblock] += g*self.Avals*simp
-                else:
-                    # RAMP penalization
-                    vals = x[i*self.nblock+1:(i+1)*self.nblock]
-                    ramp = (self.RAMP+1.0)/(1.0 + self.RAMP*(1.0 - vals))**2
-                    gobj[i*self.nblock+1:(i+1)*self.nblock] += g*self.Avals*ramp
+            # RAMP penalization
+            dA = self.Avals*(self.RAMP+1.0)/(1.0 + self.RAMP*(1.0 - xm))**2
+        gobj.reshape(self.nelems, self.nblock)[:,1:] = g[:,np.newaxis]*dA
 
         # Scale the objective gradient
         gobj /= self.obj_scale
@@ -421,36 +430,28 @@ class TrussAnalysis(ParOpt.pyParOptProblem):
         # Zero the hessian-vector product
         hvec[:] = 0.0
 
-        # Assemble the stiffness matrix along the px direction
+        # Compute the product of the stiffness matrix along the px
+        # direction with u bar by bar. Each bar adds its axial force,
+        # (E*A/Le)*elong(u), along the direction [-C, -S, C, S].
         self.setAreasLinear(px)
-        self.assembleMat(self.A, self.Kp)
-        np.dot(self.Kp, self.u, out=self.phi)
-        self.applyBCs(self.Kp, self.phi)
+        force = self.k_axial*self.A*self.elong_u
+        fe = force[:,np.newaxis]*self.bar_dirs
+        self.phi[:] = np.bincount(self.elem_dofs.ravel(), weights=fe.ravel(),
+                                  minlength=self.nvars)
+        self.applyBCs(None, self.phi)
 
         # Solve the resulting linear system of equations
-        linalg.solve_triangular(self.L, self.phi, lower=True,
-                                trans='N', overwrite_b=True)
-        linalg.solve_triangular(self.L, self.phi, lower=True, 
-                                trans='T', overwrite_b=True)
+        self.solveMat(self.phi)
         
-        # Add up the contribution to the gradient
-        for i in range(len(self.conn)):
-            # Get the first and second node numbers from the bar
-            n1 = self.conn[i][0]
-            n2 = self.conn[i][1]
-
-            # Find the element variables
-            ue = np.array([self.u[2*n1], self.u[2*n1+1],
-                           self.u[2*n2], self.u[2*n2+1]])
-            phie = np.array([self.phi[2*n1], self.phi[2*n1+1],
-                             self.phi[2*n2], self.phi[2*n2+1]])
-            
-            # Add the product to the derivative of the compliance
-            h = 2.0*np.dot(phie, np.dot(self.Ke[i,:,:], ue))
+        # Add up the contribution to the gradient:
+        # 2*phi_e^{T}*Ke*u_e = 2*(E/Le)*elong(phi)*elong(u)
+        elong_phi = self.getElongations(self.phi)
+        h = 2.0*self.k_axial*elong_phi*self.elong_u
 
-            # Add the contribution to each derivative
-            hvec[i*self.nblock+1:(i+1)*self.nblock] += h*(
-                self.Avals*self.xlinear[i*self.nblock+1:(i+1)*self.nblock])
+        # Add the contribution to each derivative
+        xlinear = self.xlinear.reshape(self.nelems, self.nblock)[:,1:]
+        hvec.reshape(self.nelems, self.nblock)[:,1:] = (
+            h[:,np.newaxis]*self.Avals*xlinear)
 
         # Evaluate the derivative
         hvec /= self.obj_scale
@@ -458,10 +459,81 @@ class TrussAnalysis(ParOpt.pyParOptProblem):
         fail = 0
         return fail
 
+    def getElongations(self, u):
+        '''
+        Compute the elongation of each bar, the projection of the
+        relative nodal displacement onto the bar direction. Since
+        Ke = (E/Le)*d*d^{T} with d = [-C, -S, C, S], the element inner
+        product v_e^{T}*Ke*u_e is (E/Le)*elong(v)*elong(u).
+
+        input:
+        u:       the nodal displacements
+
+        returns:
+        elong:   the elongation of each bar
+        '''
+
+        return np.einsum('ij,ij->i', self.bar_dirs, u[self.elem_dofs])
+
+    def solveDisplacements(self, A):
+        '''
+        Compute the displacements for the given bar areas. The previous
+        solution and factorization are reused when the areas have not
+        changed since the last call.
+
+        input:
+        A:   the bar areas
+        '''
+
+        if self.Asolve is not None and np.array_equal(A, self.Asolve):
+            return
+
+        # Assemble and factor the stiffness matrix
+        self.factorMat(A)
+        self.assembleLoadVec(self.f)
+        self.applyBCs(None, self.f)
+
+        # Solve the resulting linear system of equations
+        self.u[:] = self.f[:]
+        self.solveMat(self.u)
+
+        # Compute the bar elongations used by the gradient and the
+        # Hessian-vector product
+        self.elong_u[:] = self.getElongations(self.u)
+
+        # Store the areas used to compute the displacements
+        self.Asolve = np.array(A)
+
+        return
+
+    def computeElementMats(self, A):
+        '''
+        Compute the element stiffness matrices for the given bar areas
+
+        input:
+        A:    the bar areas
+
+        returns:
+        Ke:   the (nelems, 4, 4) element stiffness matrices
+        '''
+
+        # Form the scaled 2x2 blocks from the unique entries
+        scale = self.k_axial*A
+        P = np.empty((self.nelems, 2, 2))
+        P[:,0,0] = scale*self.k_cc
+        P[:,0,1] = scale*self.k_cs
+        P[:,1,0] = P[:,0,1]
+        P[:,1,1] = scale*self.k_ss
+
+        # Place the blocks with the sign pattern [[P, -P], [-P, P]]
+        Ke = np.einsum('ij,ekl->eikjl', self.Ke_sign, P)
+
+        return Ke.reshape(self.nelems, 4, 4)
+
     def assembleMat(self, A, K):
         '''
         Given the connectivity, nodal locations and material properties,
-        assemble the stiffness matrix
+        assemble the lower triangle of the stiffness matrix
         
         input:
         A:   the bar areas
@@ -473,22 +545,78 @@ class TrussAnalysis(ParOpt.pyParOptProblem):
         # Zero the stiffness matrix
         K[:,:] = 0.0
 
-        # Loop over each element in the mesh
-        index = 0
-        for bar, A_bar in zip(self.conn, A):
-            # Get the first and second node numbers from the bar
-            n1 = bar[0]
-            n2 = bar[1]
+        # Compute the lower triangle of the element stiffness matrices
+        Ke = self.computeElementMats(A)[:,self.Ktril[0],self.Ktril[1]]
 
-            # Create a list of the element variables for convenience
-            elem_vars = [2*n1, 2*n1+1, 2*n2, 2*n2+1]
-        
-            # Add the element stiffness matrix to the global stiffness
-            # matrix
-            K[np.ix_(elem_vars, elem_vars)] += A_bar*self.Ke[index,:,:]
+        # Add all the element stiffness matrices to the global
+        # stiffness matrix at once
+        np.add.at(K.reshape(-1), self.Kflat, Ke.ravel())
+
+        return
+
+    def assembleSparseMat(self, A):
+        '''
+        Assemble the lower triangle of the sparse stiffness matrix
+        with the boundary conditions applied
+
+        input:
+        A:   the bar areas
+
+        returns:
+        K:   the stiffness matrix in CSC format
+        '''
+
+        # Scale the element stiffness matrices by the bar areas and
+        # drop the entries eliminated by the boundary conditions
+        Ke = self.computeElementMats(A)[:,self.Ktril[0],self.Ktril[1]]
+        Ke = Ke.ravel()
+        data = np.concatenate([Ke[self.Kkeep], self.Kbc])
+
+        # Duplicate entries are summed during the conversion
+        K = sparse.csc_matrix((data, (self.Krows, self.Kcols)),
+                              shape=(self.nvars, self.nvars))
+
+        return K
+
+    def factorMat(self, A):
+        '''
+        Assemble the stiffness matrix with the boundary conditions
+        applied and compute its Cholesky factorization
+
+        input:
+        A:   the bar areas
+        '''
+
+        if cholmod is not None:
+            K = self.assembleSparseMat(A)
+            self.factor.cholesky_inplace(K)
+        else:
+            self.assembleMat(A, self.K)
+            self.applyBCs(self.K, None)
+
+            # Factor K in place and skip the finite check since K is
+            # rebuilt on every call. The transpose of K is a Fortran
+            # ordered view whose upper triangle holds the assembled
+            # entries, so LAPACK can overwrite it without a copy. This
+            # gives the upper factor U with K = U^{T}*U.
+            self.U = linalg.cholesky(self.K.T, lower=False,
+                                     overwrite_a=True, check_finite=False)
+
+        return
+
+    def solveMat(self, b):
+        '''
+        Solve K*x = b in place using the factored stiffness matrix
+        '''
+
+        # Perform the forward and backward substitutions in a single
+        # call to the solver
+        if cholmod is not None:
+            b[:] = self.factor.solve_A(b)
+        else:
+            b[:] = linalg.cho_solve((self.U, False), b, overwrite_b=True,
+                                    check_finite=False)
 
-            index += 1
-                    
         return
 
     def getLimitDisplacements(self, xinfty):
@@ -511,27 +639,14 @@ class TrussAnalysis(ParOpt.pyParOptProblem):
         uinfty = np.zeros(self.nvars)
         f = np.zeros(self.nvars)
 
-        mark = np.zeros(self.nvars, dtype=np.int)
-
-        # Loop over each element in the mesh
-        index = 0
-        for bar, A_bar in zip(self.conn, self.A):
-            # Get the first and second node numbers from the bar
-            n1 = bar[0]
-            n2 = bar[1]
-            
-            # Create a list of the element variables for convenience
-            elem_vars = [2*n1, 2*n1+1, 2*n2, 2*n2+1]
-                
-            # Add the element stiffness matrix to the global stiffness
-            # matrix
-            K[np.ix_(elem_vars, elem_vars)] += A_bar*self.Ke[index,:,:]
-            
-            # Mark variables that are non-zero
-            mark[elem_vars] = 1
-            
-            index += 1
-                
+        mark = np.zeros(self.nvars, dtype=int)
+
+        # Assemble the stiffness matrix
+        self.assembleMat(self.A, K)
+
+        # Mark variables that are non-zero
+        mark[self.elem_dofs] = 1
+
         # Reorder for the non-zero variable
         var = []
         for i in range(self.nvars):
@@ -542,14 +657,14 @@ class TrussAnalysis(ParOpt.pyParOptProblem):
         self.assembleLoadVec(f)
 
         # Apply the boundary conditions
-        self.applyBCs(self.K, self.f)
+        self.applyBCs(K, f)
 
         # Reduce the DOF to elements/nodes
         K = K[np.ix_(var, var)]
         f = f[var]
 
-        # Solve the linear system
-        uinfty[var] = np.linalg.solve(K, f)
+        # Solve the linear system using the lower triangle of K
+        uinfty[var] = linalg.solve(K, f, assume_a='pos', lower=True)
 
         return uinfty
 
@@ -558,63 +673,49 @@ class TrussAnalysis(ParOpt.pyParOptProblem):
         Create the load vector and populate the vector with entries
         '''
         
-        f[:] = 0.0
-        for node in self.loads:
-            # Add the values to the nodal locations
-            f[2*node] += self.loads[node][0]
-            f[2*node+1] += self.loads[node][1]
+        f[:] = self.floads
 
         return
 
     def applyBCs(self, K, f):
         ''' 
         Apply the boundary conditions to the stiffness matrix and load
-        vector
+        vector. Either argument may be None to skip it.
         '''
 
-        # For each node that is in the boundary condition dictionary
-        for node in self.bcs:
-            uv_list = self.bcs[node]
-
-            # For each index in the boundary conditions (corresponding to
-            # either a constraint on u and/or constraint on v
-            for index in uv_list:
-                var = 2*node + index
-
-                # Apply the boundary condition for the variable
-                K[var, :] = 0.0
-                K[:, var] = 0.0
-                K[var, var] = 1.0
-                f[var] = 0.0
+        # Zero the rows and columns of the matrix and place a unit
+        # diagonal entry for each variable with a boundary condition
+        if K is not None:
+            K[self.bc_dofs,:] = 0.0
+            K[:,self.bc_dofs] = 0.0
+            K[self.bc_dofs,self.bc_dofs] = 1.0
+        if f is not None:
+            f[self.bc_dofs] = 0.0
 
         return
 
     def evalSparseCon(self, x, con):
         '''Evaluate the sparse constraints'''
-        n = self.nblock*self.nelems
-        con[:] = (2.0*x[:n:self.nblock] - 
-                  np.sum(x[:n].reshape(-1, self.nblock), axis=1))
+        xm = x.reshape(self.nelems, self.nblock)
+        con[:] = xm[:,0] - np.sum(xm[:,1:], axis=1)
         return
 
     def addSparseJacobian(self, alpha, x, px, con):
         '''Compute the Jacobian-vector product con = alpha*J(x)*px'''
-        n = self.nblock*self.nelems
-        con[:] += alpha*(2.0*px[:n:self.nblock] - 
-                         np.sum(px[:n].reshape(-1, self.nblock), axis=1))
+        pxm = px.reshape(self.nelems, self.nblock)
+        con[:] += alpha*(pxm[:,0] - np.sum(pxm[:,1:], axis=1))
         return
 
     def addSparseJacobianTranspose(self, alpha, x, pz, out):
         '''Compute the transpose Jacobian-vector product alpha*J^{T}*pz'''
-        n = self.nblock*self.nelems
-        out[:n:self.nblock] += alpha*pz
-        for k in range(1,self.nblock):
-            out[k:n:self.nblock] -= alpha*pz
+        outm = out.reshape(self.nelems, self.nblock)
+        outm[:,0] += alpha*pz
+        outm[:,1:] -= alpha*pz[:,np.newaxis]
         return
 
     def addSparseInnerProduct(self, alpha, x, c, A):
         '''Add the results from the product J(x)*C*J(x)^{T} to A'''
-        n = self.nblock*self.nelems
-        A[:] += alpha*np.sum(c[:n].reshape(-1, self.nblock), axis=1)        
+        A[:] += alpha*np.sum(c.reshape(self.nelems, self.nblock), axis=1)
         return
 
     def getTikzPrefix(self):
@@ -639,12 +740,18 @@ class TrussAnalysis(ParOpt.pyParOptProblem):
     def printTruss(self, x, filename='file.tex', draw_list=[]):
         '''Print the truss to an output file'''
 
-        s = self.getTikzPrefix()
+        parts = [self.getTikzPrefix()]
         bar_colors = ['Black', 'ForestGreen', 'Blue']
         
         # Get the minimum value
         Amin = 1.0*min(self.Avals)
 
+        # Set the format strings for the bar style and end points
+        mat_fmt = '\\draw[line width=%f, color=%s, opacity=%f]'
+        red_fmt = '\\draw[line width=%f, color=Red]'
+        line_fmt = '(%f,%f) -- (%f,%f);\n'
+        xy = self.xpos.reshape(-1, 2)
+
         if draw_list is None:
             draw_list = range(self.nelems)
 
@@ -658,11 +765,9 @@ class TrussAnalysis(ParOpt.pyParOptProblem):
                 for j in range(self.nmats):
                     xj = x[self.nblock*i+1+j]
                     if xj > self.epsilon:
-                        s += '\\draw[line width=%f, color=%s, opacity=%f]'%(
-                            2.0*self.Avals[j]/Amin, bar_colors[j], xj)
-                        s += '(%f,%f) -- (%f,%f);\n'%(
-                            self.xpos[2*n1], self.xpos[2*n1+1], 
-                            self.xpos[2*n2], self.xpos[2*n2+1])
+                        parts.append(mat_fmt%(
+                            2.0*self.Avals[j]/Amin, bar_colors[j], xj))
+                        parts.append(line_fmt%(tuple(xy[n1]) + tuple(xy[n2])))
 
         for i in draw_list:
             # Get the node numbers for this element
@@ -672,15 +777,13 @@ class TrussAnalysis(ParOpt.pyParOptProblem):
             j = np.argmax(x[self.nblock*i+1:self.nblock*(i+1)])
             xj = x[self.nblock*i+1+j]
             if xj > self.epsilon:
-                s += '\\draw[line width=%f, color=Red]'%(
-                    2.0*self.Avals[j]/Amin)
-                s += '(%f,%f) -- (%f,%f);\n'%(
-                    self.xpos[2*n1], self.xpos[2*n1+1], 
-                    self.xpos[2*n2], self.xpos[2*n2+1])
-
-        s += '\\end{tikzpicture}'
-        s += '\\end{figure}'
-        s += '\\end{document}'
+                parts.append(red_fmt%(2.0*self.Avals[j]/Amin))
+                parts.append(line_fmt%(tuple(xy[n1]) + tuple(xy[n2])))
+
+        parts.append('\\end{tikzpicture}')
+        parts.append('\\end{figure}')
+        parts.append('\\end{document}')
+        s = ''.join(parts)
 
         # Write the file
         fp = open(filename, 'w')